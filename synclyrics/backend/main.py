@@ -1,270 +1,609 @@
-import asyncio
-import json
-import os
-import logging
-import traceback
-import time
-from datetime import datetime
-from typing import Optional
-import syncedlyrics
-
-import aiohttp
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Request
-from fastapi.staticfiles import StaticFiles
-import uvicorn
-
-# Configuration
-OPTIONS_PATH = "/data/options.json"
-CACHE_DIR = "/share/lyrics"
-
-# Configure logging
-logging.basicConfig(level=logging.INFO)
-logger = logging.getLogger("SyncLyrics")
-
-app = FastAPI()
-
-if not os.path.exists(CACHE_DIR):
-    os.makedirs(CACHE_DIR)
-
-# Global state to store the latest song for new connections
-current_state = {
-    "song": None,
-    "options": None
-}
-
-def get_options():
-    if os.path.exists(OPTIONS_PATH):
-        with open(OPTIONS_PATH, 'r') as f:
-            return json.load(f)
-    return {
-        "spotify_entity": "media_player.spotify_user",
-        "cache_size_mb": 100,
-        "show_header": True,
-        "show_progress_bar": True,
-        "show_background": True,
-        "game_mode_enabled": False,
-        "lyric_providers": ["lrclib", "musixmatch", "genius"]
-    }
-
-options = get_options()
-HA_URL = "http://supervisor/core/api"
-HA_TOKEN = os.getenv("SUPERVISOR_TOKEN")
-
-logger.info("SyncLyrics Backend starting...")
-
-class ConnectionManager:
-    def __init__(self):
-        self.active_connections: list[WebSocket] = []
-
-    async def connect(self, websocket: WebSocket):
-        await websocket.accept()
-        self.active_connections.append(websocket)
-        # Send initial state if available
-        if current_state["song"]:
-            await websocket.send_text(json.dumps({
-                "type": "update",
-                "data": current_state["song"],
-                "options": current_state["options"]
-            }))
-
-    def disconnect(self, websocket: WebSocket):
-        if websocket in self.active_connections:
-            self.active_connections.remove(websocket)
-
-    async def broadcast(self, message: str):
-        for connection in self.active_connections:
-            try:
-                await connection.send_text(message)
-            except Exception:
-                pass
-
-manager = ConnectionManager()
-
-async def fetch_lyrics(artist: str, title: str, duration: int) -> Optional[str]:
-    """Fetch lyrics using syncedlyrics library."""
-    filename = f"{artist}_{title}".replace(" ", "_").lower() + ".lrc"
-    if not os.path.exists(CACHE_DIR):
-        os.makedirs(CACHE_DIR)
-    
-    cache_path = os.path.join(CACHE_DIR, filename)
-
-    if os.path.exists(cache_path):
-        with open(cache_path, 'r', encoding='utf-8') as f:
-            return f.read()
-
-    current_options = get_options()
-    
-    def search():
-        try:
-            mx_token = current_options.get("musixmatch_token")
-            gn_token = current_options.get("genius_token")
-            if mx_token: os.environ["MUSIXMATCH_TOKEN"] = mx_token
-            if gn_token: os.environ["GENIUS_ACCESS_TOKEN"] = gn_token
-            return syncedlyrics.search(f"{artist} - {title}")
-        except Exception as e:
-            logger.error(f"Error in syncedlyrics search: {e}")
-            return None
-
-    loop = asyncio.get_event_loop()
-    lyrics = await loop.run_in_executor(None, search)
-
-    if lyrics:
-        with open(cache_path, 'w', encoding='utf-8') as f:
-            f.write(lyrics)
-        return lyrics
-    return None
-
-def parse_ha_time(time_str):
-    """Parse HA ISO time string to unix timestamp."""
-    try:
-        dt = datetime.fromisoformat(time_str.replace('Z', '+00:00'))
-        return dt.timestamp()
-    except Exception:
-        return time.time()
-
-async def monitor_ha_state():
-    """Monitor Home Assistant player state with drift compensation."""
-    last_song_key = None
-    last_broadcast_pos = -1
-    last_broadcast_state = None
-    last_options = None
-    
-    while True:
-        try:
-            current_options = get_options()
-            
-            # Detect option change
-            options_changed = last_options is not None and current_options != last_options
-            last_options = current_options
-
-            entity_id = current_options.get("spotify_entity")
-            if not HA_TOKEN:
-                await asyncio.sleep(5)
-                continue
-
-            async with aiohttp.ClientSession() as session:
-                url = f"{HA_URL}/states/{entity_id}"
-                async with session.get(url, headers={"Authorization": f"Bearer {HA_TOKEN}"}) as resp:
-                    if resp.status == 200:
-                        state_data = await resp.json()
-                        attr = state_data.get("attributes", {})
-                        
-                        title = attr.get("media_title")
-                        artist = attr.get("media_artist")
-                        state = state_data.get("state")
-                        raw_pos = attr.get("media_position")
-                        updated_at = attr.get("media_position_updated_at")
-                        
-                        # Compensate for drift
-                        current_pos = raw_pos
-                        if state == "playing" and raw_pos is not None and updated_at:
-                            diff = time.time() - parse_ha_time(updated_at)
-                            current_pos = raw_pos + diff
-
-                        song_key = f"{artist}_{title}"
-                        
-                        if not title:
-                            pass
-                        elif song_key != last_song_key or options_changed:
-                            if song_key != last_song_key:
-                                logger.info(f"Song changed: {title} by {artist}")
-                            else:
-                                logger.info("Options changed, broadcasting update")
-                            
-                            lyrics = await fetch_lyrics(artist, title, int(attr.get("media_duration", 0)))
-                            
-                            # Local proxy for images if accessed via IP
-                            image_url = attr.get("entity_picture")
-                            if image_url:
-                                image_url = f"/api/proxy?url={image_url}"
-
-                            song_info = {
-                                "title": title,
-                                "artist": artist,
-                                "album": attr.get("media_album_name"),
-                                "image": image_url,
-                                "position": current_pos,
-                                "duration": attr.get("media_duration"),
-                                "state": state,
-                                "lyrics": lyrics
-                            }
-                            
-                            # Update global state for new connections
-                            current_state["song"] = song_info
-                            current_state["options"] = current_options
-                            
-                            last_song_key = song_key
-                            last_broadcast_pos = current_pos
-                            last_broadcast_state = state
-                            await manager.broadcast(json.dumps({"type": "update", "data": song_info, "options": current_options}))
-                        else:
-                            # Song is the same, check for seek or state change
-                            time_passed = 1.0 
-                            expected_pos = last_broadcast_pos + time_passed if last_broadcast_state == "playing" else last_broadcast_pos
-                            
-                            is_seeking = abs((current_pos or 0) - (expected_pos or 0)) > 2.0
-                            is_state_change = state != last_broadcast_state
-                            
-                            if is_seeking or is_state_change:
-                                # Update position in stored state too
-                                if current_state["song"]:
-                                    current_state["song"]["position"] = current_pos
-                                    current_state["song"]["state"] = state
-                                
-                                last_broadcast_pos = current_pos
-                                last_broadcast_state = state
-                                await manager.broadcast(json.dumps({
-                                    "type": "sync",
-                                    "data": {"position": current_pos, "state": state}
-                                }))
-                    else:
-                        logger.error(f"HA API Error {resp.status}")
-        except Exception as e:
-            logger.error(f"Error: {e}")
-            traceback.print_exc()
-        
-        await asyncio.sleep(1)
-
-@app.on_event("startup")
-async def startup_event():
-    asyncio.create_task(monitor_ha_state())
-
-@app.get("/health")
-async def health_check():
-    return {"status": "ok"}
-
-@app.get("/api/proxy")
-async def proxy_image(url: str):
-    """Proxy image requests to Home Assistant."""
-    if not url:
-        return {"error": "No URL provided"}
-    
-    # Ensure the URL is from HA
-    if not url.startswith("/"):
-        return {"error": "Invalid URL"}
-
-    async with aiohttp.ClientSession() as session:
-        target_url = f"{HA_URL.replace('/api', '')}{url}"
-        async with session.get(target_url, headers={"Authorization": f"Bearer {HA_TOKEN}"}) as resp:
-            if resp.status == 200:
-                content = await resp.read()
-                from fastapi import Response
-                return Response(content=content, media_type=resp.headers.get("Content-Type"))
-            else:
-                return {"error": f"Failed to fetch image: {resp.status}"}
-
-@app.websocket("/ws")
-async def websocket_endpoint(websocket: WebSocket):
-    await manager.connect(websocket)
-    try:
-        while True:
-            await websocket.receive_text()
-    except WebSocketDisconnect:
-        manager.disconnect(websocket)
-    except Exception:
-        manager.disconnect(websocket)
-
-app.mount("/", StaticFiles(directory="/app/frontend", html=True), name="frontend")
-
-if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=8099)
+import asyncio
+import concurrent.futures
+import gzip
+import hashlib
+import os
+import logging
+import random
+import traceback
+import time
+import unicodedata
+from collections import OrderedDict
+from datetime import datetime
+from functools import lru_cache
+from typing import Optional
+
+import orjson
+import syncedlyrics
+
+import aiohttp
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Request
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from fastapi.staticfiles import StaticFiles
+from fastapi.websockets import WebSocketState
+import uvicorn
+
+# Configuration
+OPTIONS_PATH = "/data/options.json"
+CACHE_DIR = "/share/lyrics"
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("SyncLyrics")
+
+app = FastAPI(default_response_class=ORJSONResponse)
+
+os.makedirs(CACHE_DIR, exist_ok=True)
+
+# Global state to store the latest song for new connections
+current_state = {
+    "song": None,
+    "options": None,
+    "position_ts": None  # wall-clock time the stored position was accurate
+}
+
+DEFAULT_OPTIONS = {
+    "spotify_entity": "media_player.spotify_user",
+    "cache_size_mb": 100,
+    "show_header": True,
+    "show_progress_bar": True,
+    "show_background": True,
+    "game_mode_enabled": False,
+    "lyric_providers": ["lrclib", "musixmatch", "genius"]
+}
+
+# get_options is called on every monitor tick; reparse only when the
+# options file actually changed on disk
+_opts_cache = {"mtime": 0, "data": None}
+
+def get_options():
+    try:
+        st = os.stat(OPTIONS_PATH)
+    except FileNotFoundError:
+        return DEFAULT_OPTIONS
+    if st.st_mtime_ns != _opts_cache["mtime"]:
+        with open(OPTIONS_PATH, 'r') as f:
+            _opts_cache["data"] = orjson.loads(f.read())
+        _opts_cache["mtime"] = st.st_mtime_ns
+    return _opts_cache["data"]
+
+options = get_options()
+HA_URL = "http://supervisor/core/api"
+HA_WS_URL = "ws://supervisor/core/websocket"
+HA_WS_POLL_INTERVAL = 10  # seconds between fallback polls while subscribed
+HA_TOKEN = os.getenv("SUPERVISOR_TOKEN")
+# Auth header is immutable after startup; build it once
+HA_HEADERS = {"Authorization": f"Bearer {HA_TOKEN}"} if HA_TOKEN else None
+if not HA_TOKEN:
+    logger.error("SUPERVISOR_TOKEN is not set; Home Assistant monitoring disabled")
+
+# Shared keep-alive session for all supervisor traffic; created at startup
+http_session: Optional[aiohttp.ClientSession] = None
+
+logger.info("SyncLyrics Backend starting...")
+
+class ConnectionManager:
+    QUEUE_SIZE = 16
+    # Lyrics payloads run to tens of KB; compress once per broadcast and
+    # share the buffer across all clients instead of letting per-connection
+    # permessage-deflate compress N times
+    COMPRESS_MIN_SIZE = 2048
+
+    # Window in which back-to-back sync frames are merged
+    SYNC_DEBOUNCE = 0.1
+
+    def __init__(self):
+        # websocket -> (outgoing queue, sender task)
+        self.active_connections: dict[WebSocket, tuple[asyncio.Queue, asyncio.Task]] = {}
+        self._pending_sync = None
+        self._sync_flush_task = None
+
+    async def connect(self, websocket: WebSocket):
+        await websocket.accept()
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.QUEUE_SIZE)
+        task = asyncio.create_task(self._pump(websocket, queue))
+        self.active_connections[websocket] = (queue, task)
+        # Send initial state if available. The stored position is as old as
+        # the last broadcast, so fold a freshly extrapolated sync into the
+        # same frame instead of following up with a second one.
+        song = current_state["song"]
+        if song:
+            payload = {
+                "type": "update",
+                "data": song,
+                "options": current_state["options"]
+            }
+            if song.get("state") == "playing" and song.get("position") is not None \
+                    and current_state["position_ts"]:
+                payload["sync"] = {
+                    "position": song["position"] + (time.time() - current_state["position_ts"]),
+                    "state": song["state"]
+                }
+            queue.put_nowait(self._frame(orjson.dumps(payload)))
+
+    @classmethod
+    def _frame(cls, message: bytes) -> bytes:
+        """Prefix one envelope byte: 0x01 = gzip-compressed, 0x00 = raw."""
+        if len(message) >= cls.COMPRESS_MIN_SIZE:
+            return b"\x01" + gzip.compress(message, compresslevel=6)
+        return b"\x00" + message
+
+    def disconnect(self, websocket: WebSocket):
+        entry = self.active_connections.pop(websocket, None)
+        if entry:
+            entry[1].cancel()
+
+    async def _pump(self, websocket: WebSocket, queue: asyncio.Queue):
+        """Drain one client's queue so a backpressured socket only throttles itself."""
+        try:
+            while True:
+                message = await queue.get()
+                await websocket.send_bytes(message)
+        except Exception:
+            pass
+        finally:
+            self.active_connections.pop(websocket, None)
+
+    async def broadcast(self, message: bytes):
+        # Just enqueue the pre-encoded frame for each client's sender task;
+        # slow clients can't block the broadcaster. On a full queue drop the
+        # oldest message so the client converges on the latest state.
+        message = self._frame(message)
+        for websocket, (queue, _task) in list(self.active_connections.items()):
+            # Evict sockets that closed without going through disconnect so
+            # they aren't retried on every subsequent broadcast
+            if websocket.client_state != WebSocketState.CONNECTED:
+                self.disconnect(websocket)
+                continue
+            try:
+                queue.put_nowait(message)
+            except asyncio.QueueFull:
+                try:
+                    queue.get_nowait()
+                    queue.put_nowait(message)
+                except (asyncio.QueueEmpty, asyncio.QueueFull):
+                    pass
+
+    def queue_sync(self, data: dict):
+        """Debounce sync frames: a fast paused/playing flip replaces the
+        pending payload and only the final state fans out to clients."""
+        self._pending_sync = data
+        if self._sync_flush_task is None or self._sync_flush_task.done():
+            self._sync_flush_task = asyncio.create_task(self._flush_sync())
+
+    async def _flush_sync(self):
+        await asyncio.sleep(self.SYNC_DEBOUNCE)
+        data, self._pending_sync = self._pending_sync, None
+        if data is not None:
+            await self.broadcast(orjson.dumps({"type": "sync", "data": data}))
+
+manager = ConnectionManager()
+
+# Small in-memory LRU in front of the disk cache; skips the stat/open
+# entirely when a recent track comes around again
+_mem_cache: OrderedDict[tuple, str] = OrderedDict()
+_MEM_CACHE_MAX = 64
+
+# Negative-result cache: tracks with no lyrics anywhere get a .miss sentinel
+# on disk plus an in-memory expiry, so replays of instrumental/obscure songs
+# don't re-run the multi-provider search
+_miss_cache: dict[tuple, float] = {}
+_MISS_TTL = 7 * 24 * 3600
+_MISS = object()
+
+# Dedicated pool for the (slow, network-bound) syncedlyrics searches so
+# they can't starve the default executor used for file I/O
+LYRICS_POOL = concurrent.futures.ThreadPoolExecutor(
+    max_workers=4, thread_name_prefix="lyrics")
+
+def _mem_cache_put(key: tuple, lyrics: str):
+    _mem_cache[key] = lyrics
+    _mem_cache.move_to_end(key)
+    if len(_mem_cache) > _MEM_CACHE_MAX:
+        _mem_cache.popitem(last=False)
+
+async def fetch_lyrics(artist: str, title: str, duration: int) -> Optional[str]:
+    """Fetch lyrics using syncedlyrics library."""
+    mem_key = (artist, title)
+    if mem_key in _mem_cache:
+        _mem_cache.move_to_end(mem_key)
+        return _mem_cache[mem_key]
+    if _miss_cache.get(mem_key, 0) > time.time():
+        return None
+
+    # Hash the key instead of embedding raw metadata in the filename:
+    # titles with slashes/colons/emoji produced illegal or colliding paths,
+    # and fixed-length names keep large cache directories fast. NFKC
+    # normalization plus casefold makes "Feat."/"feat" style metadata
+    # variations land on the same cache entry.
+    normalized = unicodedata.normalize("NFKC", f"{artist}\x1f{title}").casefold()
+    digest = hashlib.blake2b(normalized.encode("utf-8"), digest_size=16).hexdigest()
+    cache_path = os.path.join(CACHE_DIR, digest + ".lrc")
+    # Pre-hash releases named files after the raw metadata; migrate on hit
+    legacy_path = os.path.join(
+        CACHE_DIR, f"{artist}_{title}".replace(" ", "_").lower() + ".lrc")
+    miss_path = cache_path + ".miss"
+
+    def _read_cache(path):
+        # Single open instead of an exists/open pair; missing file falls
+        # through to the miss-sentinel check
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                lyrics = f.read()
+            os.utime(path, None)  # Touch so LRU eviction keeps hot songs
+            return lyrics
+        except FileNotFoundError:
+            pass
+        try:
+            with open(legacy_path, 'r', encoding='utf-8') as f:
+                lyrics = f.read()
+            os.replace(legacy_path, path)
+            return lyrics
+        except OSError:
+            pass
+        try:
+            if time.time() - os.stat(miss_path).st_mtime < _MISS_TTL:
+                return _MISS
+        except OSError:
+            pass
+        return None
+
+    def _write_cache(path, text):
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(text)
+
+    # File I/O goes through the thread executor so slow addon storage
+    # (SD card, NFS) can't stall the event loop
+    cached = await asyncio.to_thread(_read_cache, cache_path)
+    if cached is _MISS:
+        _miss_cache[mem_key] = time.time() + _MISS_TTL
+        return None
+    if cached is not None:
+        _mem_cache_put(mem_key, cached)
+        return cached
+
+    current_options = get_options()
+    
+    def search():
+        try:
+            mx_token = current_options.get("musixmatch_token")
+            gn_token = current_options.get("genius_token")
+            if mx_token: os.environ["MUSIXMATCH_TOKEN"] = mx_token
+            if gn_token: os.environ["GENIUS_ACCESS_TOKEN"] = gn_token
+            return syncedlyrics.search(f"{artist} - {title}")
+        except Exception as e:
+            logger.error(f"Error in syncedlyrics search: {e}")
+            return None
+
+    loop = asyncio.get_event_loop()
+    lyrics = await loop.run_in_executor(LYRICS_POOL, search)
+
+    if lyrics:
+        await asyncio.to_thread(_write_cache, cache_path, lyrics)
+        _mem_cache_put(mem_key, lyrics)
+        # Keep the cap honored between the hourly sweeps too
+        limit_mb = current_options.get("cache_size_mb", 100)
+        await asyncio.to_thread(_evict_cache_overflow, limit_mb * 1024 ** 2)
+        return lyrics
+
+    _miss_cache[mem_key] = time.time() + _MISS_TTL
+    await asyncio.to_thread(_write_cache, miss_path, "")
+    return None
+
+def _evict_cache_overflow(limit_bytes: int):
+    """Delete least-recently-used .lrc files until the cache fits the cap."""
+    entries = []
+    total = 0
+    for entry in os.scandir(CACHE_DIR):
+        if not entry.is_file():
+            continue
+        st = entry.stat()
+        entries.append((st.st_atime, st.st_size, entry.path))
+        total += st.st_size
+
+    if total <= limit_bytes:
+        return
+
+    for atime, size, path in sorted(entries):
+        try:
+            os.unlink(path)
+        except OSError:
+            continue
+        total -= size
+        logger.info(f"Evicted cached lyrics: {os.path.basename(path)}")
+        if total <= limit_bytes:
+            break
+
+async def enforce_cache_cap():
+    """Periodically enforce the cache_size_mb option on the lyrics cache."""
+    while True:
+        try:
+            limit_mb = get_options().get("cache_size_mb", 100)
+            await asyncio.to_thread(_evict_cache_overflow, limit_mb * 1024 ** 2)
+        except Exception as e:
+            logger.error(f"Error enforcing cache cap: {e}")
+        await asyncio.sleep(3600)
+
+@lru_cache(maxsize=16)
+def parse_ha_time(time_str):
+    """Parse HA ISO time string to unix timestamp.
+
+    Memoized: HA resends the same string until the position anchor moves,
+    so repeat ticks skip the ISO parse entirely.
+    """
+    try:
+        dt = datetime.fromisoformat(time_str.replace('Z', '+00:00'))
+        return dt.timestamp()
+    except Exception:
+        return None
+
+async def monitor_ha_state():
+    """Monitor Home Assistant player state with drift compensation.
+
+    Prefers Home Assistant's WebSocket API (push on state changes) and
+    falls back to 1s REST polling while the socket is unavailable.
+    """
+    last_song_key = None
+    last_broadcast_pos = -1
+    last_broadcast_state = None
+    last_options = None
+    last_sync_ts = 0.0
+    # (updated_at, raw_pos) -> (position at anchor, monotonic clock at anchor)
+    anchor_key = None
+    anchor = None
+    last_broadcast_mono = None
+
+    def check_options():
+        """Reload options and report whether they changed since last check."""
+        nonlocal last_options
+        current_options = get_options()
+        options_changed = last_options is not None and current_options != last_options
+        last_options = current_options
+        return current_options, options_changed
+
+    async def handle_state(state_data, current_options, options_changed):
+        nonlocal last_song_key, last_broadcast_pos, last_broadcast_state, last_sync_ts
+        nonlocal anchor_key, anchor, last_broadcast_mono
+        attr = state_data.get("attributes", {})
+        now_mono = time.monotonic()
+
+        title = attr.get("media_title")
+        artist = attr.get("media_artist")
+        state = state_data.get("state")
+        raw_pos = attr.get("media_position")
+        updated_at = attr.get("media_position_updated_at")
+
+        # Compensate for drift. The ISO timestamp is parsed once when the
+        # anchor moves; between anchors the position advances on the
+        # monotonic clock, immune to wall-clock steps.
+        current_pos = raw_pos
+        if state == "playing" and raw_pos is not None and updated_at:
+            if (updated_at, raw_pos) != anchor_key:
+                updated_ts = parse_ha_time(updated_at)
+                base = raw_pos + (time.time() - updated_ts) if updated_ts else raw_pos
+                anchor_key = (updated_at, raw_pos)
+                anchor = (base, time.monotonic())
+            current_pos = anchor[0] + (time.monotonic() - anchor[1])
+
+        song_key = f"{artist}_{title}"
+
+        if not title:
+            pass
+        elif song_key != last_song_key or options_changed:
+            if song_key != last_song_key:
+                logger.info(f"Song changed: {title} by {artist}")
+            else:
+                logger.info("Options changed, broadcasting update")
+
+            lyrics = await fetch_lyrics(artist, title, int(attr.get("media_duration", 0)))
+
+            # Local proxy for images if accessed via IP
+            image_url = attr.get("entity_picture")
+            if image_url:
+                image_url = f"/api/proxy?url={image_url}"
+
+            song_info = {
+                "title": title,
+                "artist": artist,
+                "album": attr.get("media_album_name"),
+                "image": image_url,
+                "position": current_pos,
+                "duration": attr.get("media_duration"),
+                "state": state,
+                "lyrics": lyrics
+            }
+
+            # Update global state for new connections
+            current_state["song"] = song_info
+            current_state["options"] = current_options
+            current_state["position_ts"] = time.time()
+
+            last_song_key = song_key
+            last_broadcast_pos = current_pos
+            last_broadcast_state = state
+            last_broadcast_mono = now_mono
+            # Encode once; every client gets the same frame bytes
+            await manager.broadcast(orjson.dumps({
+                "type": "update",
+                "data": song_info,
+                "options": current_options
+            }))
+        else:
+            # Song is the same, check for seek or state change. The expected
+            # position advances by the real time elapsed since the last
+            # broadcast — events arrive at arbitrary cadence, and the old
+            # fixed 1s assumption flagged normal playback as seeking.
+            time_passed = now_mono - last_broadcast_mono if last_broadcast_mono is not None else 1.0
+            expected_pos = last_broadcast_pos + time_passed if last_broadcast_state == "playing" else last_broadcast_pos
+
+            is_seeking = abs((current_pos or 0) - (expected_pos or 0)) > 2.0
+            is_state_change = state != last_broadcast_state
+            # Coalesce: while playing, resync at most every 10s unless
+            # something actually changed; while paused, stay quiet
+            heartbeat_due = state == "playing" and (time.monotonic() - last_sync_ts) > 10
+
+            if is_seeking or is_state_change or heartbeat_due:
+                # Update position in stored state too
+                if current_state["song"]:
+                    current_state["song"]["position"] = current_pos
+                    current_state["song"]["state"] = state
+                    current_state["position_ts"] = time.time()
+
+                last_broadcast_pos = current_pos
+                last_broadcast_state = state
+                last_broadcast_mono = now_mono
+                last_sync_ts = time.monotonic()
+                manager.queue_sync({"position": current_pos, "state": state})
+
+    async def poll_once():
+        current_options, options_changed = check_options()
+        entity_id = current_options.get("spotify_entity")
+        url = f"{HA_URL}/states/{entity_id}"
+        async with http_session.get(url) as resp:
+            if resp.status == 200:
+                state_data = orjson.loads(await resp.read())
+                await handle_state(state_data, current_options, options_changed)
+            else:
+                raise RuntimeError(f"HA API Error {resp.status}")
+
+    async def run_websocket():
+        """Subscribe to entity state changes over HA's WebSocket API."""
+        current_options, _ = check_options()
+        entity_id = current_options.get("spotify_entity")
+        async with http_session.ws_connect(HA_WS_URL) as ws:
+            await ws.receive_json()  # auth_required
+            await ws.send_json({"type": "auth", "access_token": HA_TOKEN})
+            msg = await ws.receive_json()
+            if msg.get("type") != "auth_ok":
+                raise RuntimeError("HA WebSocket auth failed")
+            await ws.send_json({
+                "id": 1,
+                "type": "subscribe_trigger",
+                "trigger": {"platform": "state", "entity_id": entity_id}
+            })
+            logger.info(f"Subscribed to state changes for {entity_id}")
+
+            next_poll = time.monotonic() + HA_WS_POLL_INTERVAL
+            while True:
+                try:
+                    msg = await ws.receive(timeout=max(0.1, next_poll - time.monotonic()))
+                except asyncio.TimeoutError:
+                    # Periodic poll keeps position sync honest and picks up
+                    # option edits while the subscription is quiet
+                    await poll_once()
+                    next_poll = time.monotonic() + HA_WS_POLL_INTERVAL
+                    if last_options.get("spotify_entity") != entity_id:
+                        return  # entity changed, resubscribe
+                    continue
+
+                if msg.type == aiohttp.WSMsgType.TEXT:
+                    data = orjson.loads(msg.data)
+                    if data.get("type") != "event":
+                        continue
+                    trigger = data.get("event", {}).get("variables", {}).get("trigger", {})
+                    new_state = trigger.get("to_state")
+                    if new_state:
+                        current_options, options_changed = check_options()
+                        await handle_state(new_state, current_options, options_changed)
+                else:
+                    return  # closed or errored, reconnect
+
+    fail_count = 0
+    while True:
+        try:
+            await run_websocket()
+            fail_count = 0  # clean return means resubscribe (entity change)
+            continue
+        except Exception as e:
+            fail_count += 1
+            logger.error(f"HA WebSocket unavailable, falling back to polling: {e}")
+
+        # Poll for a while before retrying the WebSocket. Consecutive
+        # failures back off exponentially (capped at 60s, with jitter) so
+        # an unhealthy supervisor isn't hammered in a hot loop.
+        for _ in range(30):
+            try:
+                await poll_once()
+                fail_count = 0
+                delay = 1
+            except Exception as e:
+                fail_count += 1
+                delay = min(60, 2 ** fail_count) + random.random()
+                logger.error(f"Error polling HA (retry in {delay:.1f}s): {e}")
+                traceback.print_exc()
+            await asyncio.sleep(delay)
+
+
+@app.on_event("startup")
+async def startup_event():
+    global http_session
+    # Explicitly sized default executor for to_thread file I/O
+    asyncio.get_event_loop().set_default_executor(
+        concurrent.futures.ThreadPoolExecutor(max_workers=8))
+    http_session = aiohttp.ClientSession(
+        headers=HA_HEADERS,
+        connector=aiohttp.TCPConnector(limit=10, keepalive_timeout=60)
+    )
+    # Fail fast on misconfiguration instead of spinning a useless task
+    if HA_TOKEN:
+        asyncio.create_task(monitor_ha_state())
+    asyncio.create_task(enforce_cache_cap())
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    if http_session:
+        await http_session.close()
+
+@app.get("/health")
+async def health_check():
+    return {"status": "ok"}
+
+@app.get("/api/proxy")
+async def proxy_image(url: str):
+    """Proxy image requests to Home Assistant."""
+    if not url:
+        return {"error": "No URL provided"}
+    
+    # Ensure the URL is from HA
+    if not url.startswith("/"):
+        return {"error": "Invalid URL"}
+
+    target_url = f"{HA_URL.replace('/api', '')}{url}"
+    resp = await http_session.get(target_url)
+    if resp.status != 200:
+        resp.release()
+        return {"error": f"Failed to fetch image: {resp.status}"}
+
+    async def body():
+        # Stream straight through instead of buffering the whole image;
+        # the response is released once the client has it
+        try:
+            async for chunk in resp.content.iter_chunked(65536):
+                yield chunk
+        finally:
+            resp.release()
+
+    return StreamingResponse(body(), media_type=resp.headers.get("Content-Type"))
+
+@app.websocket("/ws")
+async def websocket_endpoint(websocket: WebSocket):
+    await manager.connect(websocket)
+    try:
+        while True:
+            await websocket.receive_text()
+    except WebSocketDisconnect:
+        manager.disconnect(websocket)
+    except Exception:
+        manager.disconnect(websocket)
+
+app.mount("/", StaticFiles(directory="/app/frontend", html=True), name="frontend")
+
+if __name__ == "__main__":
+    try:
+        import uvloop
+        uvloop.install()
+    except ImportError:
+        logger.info("uvloop not available, using default event loop")
+    # Compression happens once at the application layer (see
+    # ConnectionManager._frame), so skip per-connection deflate
+    uvicorn.run(app, host="0.0.0.0", port=8099, ws_per_message_deflate=False)
@@ -16,11 +16,28 @@ function connectWS() {
     const wsUrl = `${protocol}//${window.location.host}${baseUrl}/ws`;
 
     ws = new WebSocket(wsUrl);
-
-    ws.onmessage = (event) => {
-        const msg = JSON.parse(event.data);
+    ws.binaryType = 'arraybuffer';
+
+    ws.onmessage = async (event) => {
+        // Backend sends pre-encoded UTF-8 frames as binary, with one
+        // envelope byte: 0x01 = gzip-compressed, 0x00 = raw
+        let text;
+        if (typeof event.data === 'string') {
+            text = event.data;
+        } else {
+            const bytes = new Uint8Array(event.data);
+            const body = bytes.subarray(1);
+            if (bytes[0] === 1) {
+                const stream = new Blob([body]).stream().pipeThrough(new DecompressionStream('gzip'));
+                text = await new Response(stream).text();
+            } else {
+                text = new TextDecoder().decode(body);
+            }
+        }
+        const msg = JSON.parse(text);
         if (msg.type === 'update') {
             updateSong(msg.data, msg.options);
+            if (msg.sync) syncPosition(msg.sync); // piggybacked fresher position
         } else if (msg.type === 'sync') {
             syncPosition(msg.data);
         }